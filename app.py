@@ -1,12 +1,23 @@
 import os
-import uuid
+import errno
+import secrets
+import queue
+import sqlite3
+import time
+import tempfile
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime
 from pathlib import Path
 
-from flask import Flask, render_template, request, redirect, url_for, flash, abort
+from flask import (
+    Flask, render_template, stream_template, make_response, request, session,
+    redirect, url_for, flash, abort
+)
 from flask_wtf import FlaskForm
-from flask_wtf.csrf import CSRFProtect
+from flask_wtf.csrf import CSRFProtect, generate_csrf
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from werkzeug.utils import secure_filename
@@ -28,17 +39,28 @@ app.secret_key = os.environ.get("SECRET_KEY") or "dev-fallback-do-not-use-in-pro
 BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_FOLDER = BASE_DIR / "uploads"
 UPLOAD_FOLDER.mkdir(exist_ok=True)
-app.config["UPLOAD_FOLDER"] = str(UPLOAD_FOLDER)
+UPLOAD_DIR_STR = str(UPLOAD_FOLDER)
+app.config["UPLOAD_FOLDER"] = UPLOAD_DIR_STR
 app.config["MAX_CONTENT_LENGTH"] = 8 * 1024 * 1024  # 8MB
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 64KB
 
 ALLOWED_EXTENSIONS = {"pdf", "doc", "docx"}
+_ALLOWED_SUFFIXES = tuple(f".{ext}" for ext in ALLOWED_EXTENSIONS)
 ALLOWED_MIMETYPES = {
     "application/pdf",
     "application/msword",
     "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
 }
 
+# Loading the libmagic database is expensive – do it once and share
+# (python-magic serialises from_buffer calls with its own lock)
+_MIME = magic.Magic(mime=True)
+
 DB_FILE = "nexusai_jobs.db"
+DB_POOL_SIZE = 8
+ADMIN_PAGE_SIZE = 100
+ADMIN_CACHE_TTL = 5  # seconds
+ADMIN_CACHE_MAX_PAGES = 5
 
 # Logging
 logging.basicConfig(
@@ -52,63 +74,177 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Rate limiting (protects against spam submissions)
+# memory:// is per-process – point LIMITER_URI at redis://host:6379 when running
+# several gunicorn workers so they share counters (needs `pip install redis`).
+# Moving-window stops bursts of 2x the limit across a fixed-window boundary.
 limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=["60 per hour"],
-    storage_uri="memory://",
+    storage_uri=os.environ.get("LIMITER_URI", "memory://"),
+    strategy="moving-window",
 )
 
 # CSRF
 csrf = CSRFProtect(app)
 
-def init_db():
-    if not os.path.exists(DB_FILE):
-        import sqlite3
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("PRAGMA journal_mode=WAL;")  # better concurrency
-        c.execute(
+# ────────────────────────────────────────────────
+# DATABASE
+# ────────────────────────────────────────────────
+
+# Kept as a single constant so sqlite3's per-connection statement cache
+# (keyed on the SQL text) only prepares it once per pooled connection
+INSERT_APPLICATION_SQL = """
+    INSERT INTO applications
+    (position, full_name, email, phone, location, experience_years,
+     cover_letter, cv_filename, consent_given, submitted_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Pre-opened connections shared across request threads
+_pool = queue.Queue(maxsize=DB_POOL_SIZE)
+
+def _open_conn():
+    # Autocommit mode – transactions are managed explicitly where needed
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row  # templates look up columns by name
+    # Applied to every connection so existing databases get them too
+    conn.execute("PRAGMA journal_mode=WAL;")  # better concurrency
+    conn.execute("PRAGMA synchronous=NORMAL;")  # no fsync per commit in WAL mode
+    conn.execute("PRAGMA mmap_size=268435456;")  # 256MB
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA cache_size=-20000;")  # ~20MB
+    return conn
+
+@contextmanager
+def get_conn():
+    conn = _pool.get()
+    try:
+        yield conn
+    finally:
+        _pool.put(conn)
+
+@contextmanager
+def write_txn():
+    # Take the write lock up front instead of upgrading a deferred transaction
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+# page -> (fetched_at, total, rows); cleared whenever applications are inserted
+_admin_cache = {}
+
+def insert_applications(rows):
+    # executemany prepares the INSERT once for the whole batch (bulk imports etc.)
+    with write_txn() as conn:
+        conn.executemany(INSERT_APPLICATION_SQL, rows)
+    _admin_cache.clear()
+
+APPLICATIONS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        position TEXT NOT NULL,
+        full_name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        location TEXT NOT NULL,
+        experience_years INTEGER NOT NULL,
+        cover_letter TEXT,
+        cv_filename TEXT,
+        consent_given INTEGER NOT NULL DEFAULT 0,
+        submitted_at INTEGER NOT NULL  -- unix seconds
+    )
+"""
+
+def _submitted_at_type(conn):
+    columns = {
+        row["name"]: row["type"]
+        for row in conn.execute("PRAGMA table_info(applications)")
+    }
+    return columns.get("submitted_at")
+
+def _migrate_submitted_at():
+    # Older databases stored submitted_at as local-time "%Y-%m-%d %H:%M:%S" text
+    with write_txn() as conn:
+        # Re-check under the write lock – another worker may have migrated already,
+        # and running this again on integers would overwrite them with garbage
+        if _submitted_at_type(conn) != "TEXT":
+            return
+        conn.execute(APPLICATIONS_TABLE_SQL.format(name="applications_new"))
+        conn.execute(
             """
-            CREATE TABLE applications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                position TEXT NOT NULL,
-                full_name TEXT NOT NULL,
-                email TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                location TEXT NOT NULL,
-                experience_years INTEGER NOT NULL,
-                cover_letter TEXT,
-                cv_filename TEXT,
-                consent_given INTEGER NOT NULL DEFAULT 0,
-                submitted_at TEXT NOT NULL
-            )
+            INSERT INTO applications_new
+            SELECT id, position, full_name, email, phone, location, experience_years,
+                   cover_letter, cv_filename, consent_given,
+                   CAST(strftime('%s', submitted_at, 'utc') AS INTEGER)
+            FROM applications
             """
         )
-        conn.commit()
-        conn.close()
-        logger.info("Database and applications table created.")
+        conn.execute("DROP TABLE applications")
+        conn.execute("ALTER TABLE applications_new RENAME TO applications")
+    logger.info("Migrated applications.submitted_at to unix timestamps.")
+
+def init_db():
+    while not _pool.full():
+        _pool.put(_open_conn())
+
+    # IF NOT EXISTS instead of an os.path.exists() check – no race on cold start
+    with get_conn() as conn:
+        conn.execute(APPLICATIONS_TABLE_SQL.format(name="applications"))
+        needs_migration = _submitted_at_type(conn) == "TEXT"
+    if needs_migration:
+        _migrate_submitted_at()
+
+    # Runs on every startup so existing databases pick up new indexes
+    with get_conn() as conn:
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_apps_submitted_at "
+            "ON applications(submitted_at DESC)"
+        )
 
 init_db()
 
+@app.template_filter("timestamp")
+def format_timestamp(value, fmt="%Y-%m-%d %H:%M:%S"):
+    return datetime.fromtimestamp(value).strftime(fmt)
+
 # ────────────────────────────────────────────────
 # FORMS
 # ────────────────────────────────────────────────
 
+def allowed_file(filename):
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
+
+def strip_filter(value):
+    return value.strip() if value else value
+
 class ApplicationForm(FlaskForm):
     position = SelectField(
         "Position", validators=[DataRequired(message="Please select a position")]
     )
-    full_name = StringField("Full Name", validators=[DataRequired(), Length(max=120)])
-    email = StringField("Email", validators=[DataRequired(), Email()])
-    phone = StringField("Phone Number", validators=[DataRequired(), Length(max=30)])
-    location = StringField("Location (City, Country)", validators=[DataRequired(), Length(max=100)])
+    full_name = StringField(
+        "Full Name", validators=[DataRequired(), Length(max=120)], filters=[strip_filter]
+    )
+    email = StringField("Email", validators=[DataRequired(), Email()], filters=[strip_filter])
+    phone = StringField(
+        "Phone Number", validators=[DataRequired(), Length(max=30)], filters=[strip_filter]
+    )
+    location = StringField(
+        "Location (City, Country)",
+        validators=[DataRequired(), Length(max=100)],
+        filters=[strip_filter],
+    )
     experience = IntegerField(
         "Years of Relevant Experience",
         validators=[DataRequired(), NumberRange(min=0, max=60)],
     )
     cover_letter = TextAreaField(
-        "Cover Letter", validators=[DataRequired(), Length(max=4000)]
+        "Cover Letter", validators=[DataRequired(), Length(max=4000)], filters=[strip_filter]
     )
     cv = FileField("CV/Resume", validators=[Optional()])
     consent = StringField(  # We'll check it's "on"
@@ -117,15 +253,13 @@ class ApplicationForm(FlaskForm):
 
     def validate_cv(self, field):
         if field.data and field.data.filename:
-            filename = field.data.filename
-            if "." not in filename or filename.rsplit(".", 1)[1].lower() not in ALLOWED_EXTENSIONS:
+            if not allowed_file(field.data.filename):
                 raise ValueError("Only PDF, DOC, DOCX allowed")
 
             # Real content-type check
-            mime = magic.Magic(mime=True)
             content = field.data.read(1024)
             field.data.seek(0)
-            detected = mime.from_buffer(content)
+            detected = _MIME.from_buffer(content)
             if detected not in ALLOWED_MIMETYPES:
                 raise ValueError("Invalid file content – only PDF/Word documents allowed")
 
@@ -137,23 +271,108 @@ class ApplicationForm(FlaskForm):
 def home():
     return render_template("index.html")
 
+CSRF_PLACEHOLDER = "__CSRF__"
+
+# Populate positions dynamically if you want – for now static
+POSITION_CHOICES = (
+    ("", "Select Position"),
+    # You can keep the same groups as in HTML or load from config later
+    ("Senior Full-Stack Developer", "Senior Full-Stack Developer"),
+    ("Junior Developer", "Junior Developer"),
+    # ... add others
+)
+
+def _careers_form(**kwargs):
+    form = ApplicationForm(**kwargs)
+    form.position.choices = POSITION_CHOICES
+    return form
+
+@lru_cache(maxsize=1)
+def _cached_careers_body():
+    # Rendered once without a CSRF token – the per-user token is swapped in later
+    form = _careers_form(meta={"csrf": False})
+    return render_template("careers.html", form=form, csrf_placeholder=CSRF_PLACEHOLDER)
+
 @app.route("/careers")
 def careers():
-    form = ApplicationForm()
-    # Populate positions dynamically if you want – for now static
-    form.position.choices = [
-        ("", "Select Position"),
-        # You can keep the same groups as in HTML or load from config later
-        ("Senior Full-Stack Developer", "Senior Full-Stack Developer"),
-        ("Junior Developer", "Junior Developer"),
-        # ... add others
-    ]
-    return render_template("careers.html", form=form)
+    # Flash messages are per-user, so those pages can't come from the cache
+    if session.get("_flashes"):
+        return render_template("careers.html", form=_careers_form())
+
+    # No ETag: the signed CSRF token changes every request, so it would never match
+    resp = make_response(_cached_careers_body().replace(CSRF_PLACEHOLDER, generate_csrf()))
+    resp.headers["Cache-Control"] = "private, must-revalidate"
+    return resp
+
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+def _write_synced(stream, dest):
+    # Stream in fixed-size chunks so memory use doesn't grow with file size
+    stream.seek(0)
+    while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+        dest.write(chunk)
+    dest.flush()
+    _fdatasync(dest.fileno())
+
+def _open_tmpfile(directory):
+    # O_TMPFILE is Linux-only and not every filesystem supports it
+    try:
+        return os.open(directory, os.O_TMPFILE | os.O_WRONLY, 0o644)
+    except AttributeError:
+        return None
+    except OSError as e:
+        if e.errno in (errno.EOPNOTSUPP, errno.EISDIR, errno.EINVAL):
+            return None
+        raise
+
+def _save_upload(stream, save_path):
+    # Write to an anonymous/temporary file and only link it into place once it's
+    # complete and synced, so a crash never leaves a partial CV behind
+    directory, name = os.path.split(save_path)
+
+    fd = _open_tmpfile(directory)
+    if fd is not None:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            with os.fdopen(fd, "wb", buffering=1024 * 1024) as dest:
+                _write_synced(stream, dest)
+                # Passing dst_dir_fd makes CPython use linkat(AT_SYMLINK_FOLLOW),
+                # which resolves the /proc magic link – plain link(2) gets EXDEV
+                os.link(f"/proc/self/fd/{dest.fileno()}", name, dst_dir_fd=dir_fd)
+        finally:
+            os.close(dir_fd)
+        return
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, "wb", buffering=1024 * 1024) as dest:
+            _write_synced(stream, dest)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, save_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+# Background workers for application inserts
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="persist")
+
+def _persist_application(row, cv_filename):
+    try:
+        insert_applications([row])
+        logger.info(f"New application: {row[0]} – {row[2]}")
+    except Exception:
+        logger.exception(f"Application submission failed (CV: {cv_filename})")
+        # Nothing references the upload any more – don't leave it orphaned
+        if cv_filename:
+            try:
+                os.unlink(f"{UPLOAD_DIR_STR}/{cv_filename}")
+            except OSError:
+                logger.exception(f"Could not remove orphaned CV: {cv_filename}")
 
 @app.route("/apply", methods=["POST"])
 @limiter.limit("6 per hour")  # anti-spam
 def apply():
-    form = ApplicationForm()
+    form = _careers_form()
 
     if not form.validate_on_submit():
         for field, errors in form.errors.items():
@@ -166,47 +385,37 @@ def apply():
     cv_file = form.cv.data
     if cv_file and cv_file.filename:
         ext = cv_file.filename.rsplit(".", 1)[1].lower()
-        cv_filename = f"{uuid.uuid4().hex}.{ext}"
-        save_path = os.path.join(app.config["UPLOAD_FOLDER"], cv_filename)
-        cv_file.save(save_path)
+        name = secrets.token_hex(16)
+        # Shard by the first two hex chars so no single directory grows huge
+        subdir = UPLOAD_FOLDER / name[:2]
+        subdir.mkdir(exist_ok=True)
+        cv_filename = f"{name[:2]}/{name}.{ext}"
+        save_path = f"{UPLOAD_DIR_STR}/{cv_filename}"  # name is our own hex token
+        _save_upload(cv_file.stream, save_path)
         logger.info(f"CV uploaded: {cv_filename}")
 
-    try:
-        import sqlite3
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute(
-            """
-            INSERT INTO applications
-            (position, full_name, email, phone, location, experience_years,
-             cover_letter, cv_filename, consent_given, submitted_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                form.position.data,
-                form.full_name.data.strip(),
-                form.email.data.strip(),
-                form.phone.data.strip(),
-                form.location.data.strip(),
-                form.experience.data,
-                form.cover_letter.data.strip(),
-                cv_filename,
-                1 if form.consent.data == "on" else 0,
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            ),
-        )
-        conn.commit()
-        conn.close()
-
-        flash("Application submitted successfully! We'll be in touch soon.", "success")
-        logger.info(f"New application: {form.position.data} – {form.email.data}")
+    row = (
+        form.position.data,
+        form.full_name.data,
+        form.email.data,
+        form.phone.data,
+        form.location.data,
+        form.experience.data,
+        form.cover_letter.data,
+        cv_filename,
+        1 if form.consent.data == "on" else 0,
+        int(time.time()),
+    )
 
-    except Exception as e:
-        logger.exception("Application submission failed")
-        flash("Sorry, something went wrong. Please try again later.", "error")
+    # The applicant only needs an ack – don't make them wait on the DB write
+    _executor.submit(_persist_application, row, cv_filename)
+    flash("Application submitted successfully! We'll be in touch soon.", "success")
 
     return redirect(url_for("careers") + "#apply")
 
+def _page_count(total):
+    return max(-(-total // ADMIN_PAGE_SIZE), 1)
+
 # Keep admin simple for now – PROTECT THIS PROPERLY LATER
 @app.route("/admin/applications")
 def view_applications():
@@ -214,14 +423,37 @@ def view_applications():
     # For now – at least log access
     logger.warning(f"Admin applications viewed from IP: {request.remote_addr}")
 
-    import sqlite3
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT * FROM applications ORDER BY submitted_at DESC")
-    rows = c.fetchall()
-    conn.close()
+    page = max(request.args.get("page", 1, type=int), 1)
+
+    # A few seconds of staleness is fine for the dashboard and saves the queries
+    cached = _admin_cache.get(page)
+    if cached and time.monotonic() - cached[0] < ADMIN_CACHE_TTL:
+        _, total, rows = cached
+    else:
+        with get_conn() as conn:
+            total = conn.execute("SELECT COUNT(*) FROM applications").fetchone()[0]
+            # Out-of-range pages show the last page (and keep OFFSET within int64)
+            page = min(page, _page_count(total))
+            rows = conn.execute(
+                "SELECT * FROM applications ORDER BY submitted_at DESC LIMIT ? OFFSET ?",
+                (ADMIN_PAGE_SIZE, (page - 1) * ADMIN_PAGE_SIZE),
+            ).fetchall()
+        now = time.monotonic()
+        # Drop stale pages and cap the size – page numbers come from the query string
+        for key, entry in _admin_cache.copy().items():
+            if now - entry[0] >= ADMIN_CACHE_TTL:
+                _admin_cache.pop(key, None)
+        if len(_admin_cache) < ADMIN_CACHE_MAX_PAGES:
+            _admin_cache[page] = (now, total, rows)
 
-    return render_template("admin.html", applications=rows)
+    # Stream the rendered page so the client gets bytes before the table is done
+    return stream_template(
+        "admin.html",
+        applications=rows,
+        total=total,
+        page=page,
+        pages=_page_count(total),
+    )
 
 if __name__ == "__main__":
     # Development only